@@ -24,6 +24,8 @@ code is inserted.
     # out.append is one such example, file.write is another.
     emit = Emitter(writer=out.append, base_indent="", indent_step="   ")
     emit("out.py", greet(thing="Gordon"))
+    # output is buffered, pass it to the writer
+    emit.flush()
 
     # render result to string
     out_str = "".join(out)
@@ -82,22 +84,39 @@ NOTE - if you have just one line of code, you can also write the first parts
     # <<end>>
 """
 
-from typing import Any, Callable, Dict, Optional, List, Union, Iterator, Tuple, Protocol
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Optional,
+    List,
+    Union,
+    Iterator,
+    Tuple,
+    Protocol,
+    overload,
+)
 
 import argparse
+import functools
+import inspect
 from pathlib import Path
-import re
-import shutil
 import tempfile
 import sys
 import os
+from types import CodeType
 
 __version__ = "0.3.0"
 __description__ = "Crowbar - When clever hacking fails, crude whacking works!"
 
 
 # Special marker types
+# NOTE: markers deliberately compare (and hash) by identity only, the
+#       emitter looks them up as `arg is marker`.
 class _Marker:
+    __slots__ = ("__type",)
+
     def __init__(self, marker_type: str):
         self.__type = marker_type
 
@@ -116,7 +135,8 @@ MARKER_START = "<<crowbar"
 MARKER_CODE_END = ">>"
 MARKER_OUTPUT_END = "<<end>>"
 
-rgx_leading_ws = re.compile(r"^(\s*)")
+# output is collected and written in chunks of (at least) this many characters
+WRITE_CHUNK_SIZE = 64 * 1024
 
 # Type definitions
 Fpath = Union[str, Path]
@@ -136,8 +156,8 @@ EvalCodeFn = Callable[[str, str, str], str]
 
 def str_leading_ws(s: str) -> str:
     """get leading whitespace from `s` as string."""
-    m = rgx_leading_ws.match(s)
-    return m.group(1) if m else ""
+    # str.isspace() and the regex `\s` agree on what is whitespace
+    return s[: len(s) - len(s.lstrip())]
 
 
 class CrowbarError(Exception):
@@ -189,11 +209,26 @@ class FileParseError(CrowbarError):
         super().__init__(f"Error parsing '{fpath}':\n{type(e).__name__}: {str(e)}")
 
 
+# cache of a pure component, maps call arguments (and their types) to the
+# arguments its body passed to emit()
+RenderCache = Dict[
+    Tuple[Tuple[Any, ...], Tuple[type, ...], FrozenSet[Tuple[str, Any, type]]],
+    Tuple[Any, ...],
+]
+
+
 class ComponentClosure:
-    def __init__(self, func: ComponentFunction, args: Tuple[Any], ctx: Dict[str, Any]):
+    def __init__(
+        self,
+        func: ComponentFunction,
+        args: Tuple[Any],
+        ctx: Dict[str, Any],
+        cache: Optional[RenderCache] = None,
+    ):
         self.__func = func
         self.__args = args
         self.__kwargs = ctx
+        self.__cache = cache
         # copy over metadata too
         self.__name__ = f"ComponentClosure[{func.__name__}]"
         self.__doc__ = func.__doc__
@@ -206,12 +241,35 @@ class ComponentClosure:
         return self.__func
 
     def __call__(self, emit: EmitFunction) -> None:
-        self.__func(emit, *self.__args, **self.__kwargs)
+        if self.__cache is None:
+            self.__func(emit, *self.__args, **self.__kwargs)
+            return
+        try:
+            # types are part of the key, 1, 1.0 and True are equal but render differently
+            key = (
+                self.__args,
+                tuple(map(type, self.__args)),
+                frozenset((k, v, type(v)) for k, v in self.__kwargs.items()),
+            )
+            tokens = self.__cache.get(key)
+        except TypeError:
+            # unhashable arguments, cannot be cached
+            self.__func(emit, *self.__args, **self.__kwargs)
+            return
+        if tokens is None:
+            # record what the body emits, replaying it renders the same output
+            recorded: List[Any] = []
+            self.__func(
+                lambda *args: recorded.extend(args), *self.__args, **self.__kwargs
+            )
+            tokens = self.__cache[key] = tuple(recorded)
+        emit(*tokens)
 
 
 class Component:
-    def __init__(self, func: ComponentFunction):
+    def __init__(self, func: ComponentFunction, pure: bool = False):
         self.__func = func
+        self._cache: Optional[RenderCache] = {} if pure else None
         # copy over metadata too
         self.__name__ = func.__name__
         self.__doc__ = func.__doc__
@@ -220,10 +278,22 @@ class Component:
         self.__annotations__ = getattr(func, "__annotations__", {})
 
     def __call__(self, *args: Any, **kwargs: Any) -> ComponentClosure:
-        return ComponentClosure(self.__func, args, kwargs)
+        return ComponentClosure(self.__func, args, kwargs, self._cache)
+
+
+@overload
+def component(func: ComponentFunction) -> Component: ...
 
 
-def component(func: ComponentFunction) -> Component:
+@overload
+def component(
+    *, pure: bool = ...
+) -> Callable[[ComponentFunction], Component]: ...
+
+
+def component(
+    func: Optional[ComponentFunction] = None, *, pure: bool = False
+) -> Union[Component, Callable[[ComponentFunction], Component]]:
     """
     Decorator to create an Crowbar component.
 
@@ -232,15 +302,66 @@ def component(func: ComponentFunction) -> Component:
         def greet(emit, name):
             emit("Hello", nl, f"Name: {name}")
 
+        @component(pure=True)
+        def banner(emit, title):
+            emit(f"/* {title} */")
+
     Args:
         func: Function that takes emit and any positional- and keyword arguments
               desired.
+        pure: If True, the component's output depends only on its arguments.
+              What it emits is then cached per (hashable) set of arguments and
+              their types, and replayed instead of running the function body
+              again. The cache is unbounded and lives as long as the component,
+              so only use it for components rendered with few distinct arguments.
 
     Returns:
         A Component, which can be called with a context to produce a Component closure
         which in turn can be rendered with emit().
     """
-    return Component(func)
+    if func is None:
+        return lambda func: Component(func, pure=pure)
+    return Component(func, pure=pure)
+
+
+def component_template(
+    tmpl: str,
+) -> Callable[[ComponentFunction], Component]:
+    """
+    Decorator to create a Crowbar component from a `str.format` template.
+
+    The decorated function only provides the component's name and signature,
+    its body is never run. Arguments are substituted into the template by
+    parameter name and each line of the template is emitted as a line of its own.
+
+    Usage:
+        @component_template('printf("Hello {name}\\n");')
+        def greet(emit, name): ...
+
+    Args:
+        tmpl: template string, `{param}` fields refer to the function's
+              parameters (excluding `emit`), literal braces must be doubled.
+
+    Returns:
+        A decorator, turning the function into a Component.
+    """
+    # only lines with fields (or escaped braces) need formatting
+    lines = tuple((line, "{" in line or "}" in line) for line in tmpl.split("\n"))
+
+    def decorator(func: ComponentFunction) -> Component:
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def render(emit: EmitFunction, *args: Any, **kwargs: Any) -> None:
+            # raises the usual TypeErrors on missing, unknown or repeated arguments
+            bound = sig.bind(emit, *args, **kwargs)
+            bound.apply_defaults()
+            ctx = bound.arguments
+            emit(*[line.format_map(ctx) if fmt else line for line, fmt in lines])
+
+        return Component(render)
+
+    return decorator
 
 
 class Emitter:
@@ -256,67 +377,152 @@ class Emitter:
             indent_step: String added for each indent level (default: "  ")
 
         Returns:
-            None - all output is passed to the `writer`
+            None - output is buffered and passed to the `writer` on `flush()`
         """
         self.writer = writer
         self.indent_step = indent_step
         self.base_indent = base_indent
+        self._parts: List[str] = []
+        self._append = self._parts.append
+        # bound once, handed to every component rendered
+        self._emit = self.__call__
+        # dispatch on the exact type of each argument, markers by identity
+        self._type_tbl: Dict[type, Callable[[Any], None]] = {
+            str: self._do_str,
+            _Marker: self._do_marker,
+            ComponentClosure: self._do_closure,
+            type(None): self._do_none,
+            Component: self._do_component,
+        }
+        self._marker_tbl: Dict[_Marker, Callable[[], None]] = {
+            nl: self._do_nl,
+            fl: self._do_fl,
+            lc: self._do_lc,
+            indent: self._do_indent,
+            dedent: self._do_dedent,
+        }
         self.reset()
 
     def reset(self) -> None:
         self.indent = True
         self.newline = False
         self.indent_level = 0
+        self._recompute_indent()
         self._first = True
 
+    def flush(self) -> None:
+        """Pass all buffered output to the `writer` in a single call."""
+        if self._parts:
+            self.writer("".join(self._parts))
+            self._parts.clear()
+
     def get_indent_string(self) -> str:
-        return self.base_indent + (self.indent_step * self.indent_level)
+        return self._indent_str
+
+    def _recompute_indent(self) -> None:
+        # only changes on indent/dedent, cached so tokens don't rebuild it
+        self._indent_str = self.base_indent + (self.indent_step * self.indent_level)
 
     def __call__(self, *args: Any) -> None:
-        for arg in args:
-            if isinstance(arg, _Marker):
-                if arg == lc:
-                    self.indent = self.newline = False
-                elif arg == fl and not self._first:
-                    # first line is by definition a FL, don't change the emitter state
-                    self.indent = self.newline = True
-                elif arg == nl:
-                    self.writer("\n")
-                    self.indent = True
-                    self.newline = not self._first
-                elif arg == indent:
-                    self.indent_level += 1
-                elif arg == dedent:
-                    self.indent_level = max(0, self.indent_level - 1)
-            elif isinstance(arg, list):
-                self.__call__(indent, *arg, dedent)
-            elif isinstance(arg, ComponentClosure):
-                # component with context, provide emit function
-                arg(self.__call__)
-            elif arg is None:
-                continue
-            elif isinstance(arg, Component):
-                raise TypeError(
-                    f"emit() does not accept raw components - you must call it first, provide a context"
-                )
+        # hot loop, look up builtins and handlers once per call, not per argument
+        get_handler = self._type_tbl.get
+        do_other = self._do_other
+        _type = type
+        _list = list
+        # nested lists are walked using a stack of iterators rather than recursion,
+        # each level below the top is one level of indentation
+        stack = [iter(args)]
+        while stack:
+            for arg in stack[-1]:
+                arg_type = _type(arg)
+                if arg_type is _list:
+                    self._do_indent()
+                    stack.append(iter(arg))
+                    break
+                handler = get_handler(arg_type, do_other)
+                handler(arg)
             else:
-                if self.newline:
-                    self.writer("\n")
-                if self.indent:
-                    self.writer(self.get_indent_string())
-                self.writer(str(arg))
-                self.indent = self.newline = True
-                self._first = False
+                stack.pop()
+                if stack:
+                    self._do_dedent()
+
+    def _do_str(self, arg: Any) -> None:
+        # assemble the token into one string, one append per token
+        text = str(arg)
+        if self.indent:
+            text = self._indent_str + text
+        if self.newline:
+            text = "\n" + text
+        self._append(text)
+        self.indent = self.newline = True
+        self._first = False
+
+    def _do_marker(self, arg: _Marker) -> None:
+        handler = self._marker_tbl.get(arg)
+        if handler is not None:
+            handler()
+
+    def _do_lc(self) -> None:
+        self.indent = self.newline = False
+
+    def _do_fl(self) -> None:
+        # first line is by definition a FL, don't change the emitter state
+        if not self._first:
+            self.indent = self.newline = True
+
+    def _do_nl(self) -> None:
+        self._append("\n")
+        self.indent = True
+        self.newline = not self._first
+
+    def _do_indent(self) -> None:
+        self.indent_level += 1
+        self._recompute_indent()
+
+    def _do_dedent(self) -> None:
+        if self.indent_level > 0:
+            self.indent_level -= 1
+            self._recompute_indent()
+
+    def _do_list(self, arg: List[Any]) -> None:
+        self._do_indent()
+        self.__call__(*arg)
+        self._do_dedent()
+
+    def _do_closure(self, arg: ComponentClosure) -> None:
+        # component with context, provide emit function
+        arg(self._emit)
+
+    def _do_none(self, arg: None) -> None:
+        pass
+
+    def _do_component(self, arg: Component) -> None:
+        raise TypeError(
+            f"emit() does not accept raw components - you must call it first, provide a context"
+        )
+
+    def _do_other(self, arg: Any) -> None:
+        # subclasses of the dispatched types, anything else is rendered as text
+        if isinstance(arg, _Marker):
+            self._do_marker(arg)
+        elif isinstance(arg, list):
+            self._do_list(arg)
+        elif isinstance(arg, ComponentClosure):
+            self._do_closure(arg)
+        elif isinstance(arg, Component):
+            self._do_component(arg)
+        else:
+            self._do_str(arg)
 
 
 def _block_parser(
-    iter: Iterator[str], eval: EvalCodeFn, indent_step: str
+    lines: List[str], eval: EvalCodeFn, indent_step: str
 ) -> Iterator[Tuple[bool, str]]:
     """
-    Parse lines provided by `iter`, evaluating code in special blocks.
+    Parse `lines`, evaluating code in special blocks.
 
     Args:
-        iter: provides the content to analyze, line-by-line
+        lines: the content to analyze, line-by-line
         eval: function with which to evaluate code sections
         indent_step: the string used for each level of indentation
 
@@ -325,41 +531,37 @@ def _block_parser(
         whether the line is part of the code block or not, and the string is
         the line itself.
     """
-    lineno: int = 0
-
-    def next_line() -> Optional[str]:
-        nonlocal lineno
-        try:
-            line = next(iter)
-            lineno += 1
-            return line
-        except StopIteration:
-            return None
-
-    line: Optional[str] = next_line()
-    while line is not None:
+    num_lines = len(lines)
+    # index of the next line to read, equal to the (1-based) number of the last line read
+    i = 0
+    while i < num_lines:
+        line = lines[i]
+        i += 1
         _start = line.find(MARKER_START)
         yield _start != -1, line
         if _start != -1:
-            _start_lineno = lineno
+            _start_lineno = i
             _start_line = line
-            _end = line.find(MARKER_CODE_END)
+            # each line is scanned once for the one marker possible at that point,
+            # the opening line only past the opening marker.
+            _code_start = _start + len(MARKER_START)
+            _end = line.find(MARKER_CODE_END, _code_start)
             if _end != -1:
-                code_lines = [line[_start + len(MARKER_START) : _end].lstrip()]
+                code_lines = [line[_code_start:_end].lstrip()]
                 base_indent = str_leading_ws(line)
             else:
-                code_lines = []
-                line = next_line()
-                while line is not None and MARKER_CODE_END not in line:
-                    code_lines.append(line)
-                    yield True, line
-                    line = next_line()
-                if line is None:
+                code_start = i
+                while i < num_lines and MARKER_CODE_END not in lines[i]:
+                    yield True, lines[i]
+                    i += 1
+                if i == num_lines:
                     raise UnexpectedEOF(
                         _start_lineno,
                         f"reached end of file looking for end of code-section to block starting at line {_start_lineno}",
                     )
-                yield True, line
+                code_lines = lines[code_start:i]
+                yield True, lines[i]
+                i += 1  # skip code end marker line
                 pref = code_lines[0][:_start]
                 if len(pref) < _start:
                     # TODO: verify we can trigger this
@@ -368,23 +570,24 @@ def _block_parser(
                     )
                 if len(code_lines) > 1:
                     # all code lines must share the indentation of the block opening line
-                    for i, cl in enumerate(code_lines[1:]):
+                    for j, cl in enumerate(code_lines[1:]):
                         if cl[:_start] != pref:
                             raise IndentationError(
                                 block_start_lineno=_start_lineno,
-                                code_lineno=_start_lineno + 2 + i,
+                                code_lineno=_start_lineno + 2 + j,
                             )
                 base_indent = str_leading_ws(_start_line)
                 code_lines = [cl[_start:] for cl in code_lines]  # strip prefix
             # skip past all the output from last run
-            line = next_line()  # skip code end marker line
-            while line is not None and MARKER_OUTPUT_END not in line:
-                line = next_line()  # skip output lines
-            if line is None:
+            while i < num_lines and MARKER_OUTPUT_END not in lines[i]:
+                i += 1
+            if i == num_lines:
                 raise UnexpectedEOF(
                     _start_lineno,
                     f"reached end of file looking for end of block which started at line {_start_lineno}",
                 )
+            end_line = lines[i]
+            i += 1
             try:
                 generated_output = eval("".join(code_lines), base_indent, indent_step)
             except Exception as e:
@@ -393,10 +596,7 @@ def _block_parser(
             if generated_output:
                 yield False, generated_output
                 yield False, "\n"
-            if line is not None:
-                yield True, line  # marker output end line
-
-        line = next_line()  # ready next line for loop
+            yield True, end_line  # marker output end line
 
 
 class CrowbarPreprocessor:
@@ -419,30 +619,53 @@ class CrowbarPreprocessor:
     """
 
     def __init__(self) -> None:
-        pass
-
-    def execute_code_block(self, code: str, base_indent: str, indent_step: str) -> str:
-        """Execute Crowbar code and return generated output"""
-        # Set up execution environment with persistent state
-        crowbar = sys.modules[__name__]
-        sys.modules["crowbar"] = crowbar
-
-        exec_globals = {
-            "crowbar": crowbar,
+        # compiled code blocks, keyed by their source
+        self._code_cache: Dict[str, CodeType] = {}
+        # output of the code block being executed, reused between blocks
+        self._scratch: List[str] = []
+        # names every code block starts out with
+        self._base_globals: Dict[str, Any] = {
+            "crowbar": sys.modules[__name__],
             "component": component,
+            "component_template": component_template,
             "nl": nl,
             "fl": fl,
             "lc": lc,
             "indent": indent,
             "dedent": dedent,
-            "indent_by": indent_step,
             "__builtins__": __builtins__,
-            # Include previously imported modules and globals
-            **self.crowbar_globals,
         }
+        # directory this preprocessor put at sys.path[1], see `_use_input_dir`
+        self._input_dir: Optional[str] = None
+        self._reset_globals()
+
+    def _use_input_dir(self, input_dir: str) -> None:
+        # put the directory at sys.path[1], ahead of other entries so they cannot
+        # shadow its modules. It stays there for the files after it, so a batch of
+        # files from one directory edits sys.path only once.
+        if sys.path[1:2] == [input_dir]:
+            return
+        if self._input_dir is not None and sys.path[1:2] == [self._input_dir]:
+            # replace the directory added for an earlier file, rather than pile up
+            del sys.path[1]
+        sys.path.insert(1, input_dir)
+        self._input_dir = input_dir
+
+    def _reset_globals(self) -> None:
+        # globals shared by all code blocks of a file, imports and definitions
+        # of one block are visible to the blocks after it
+        self._persistent_globals: Dict[str, Any] = self._base_globals.copy()
+
+    def execute_code_block(self, code: str, base_indent: str, indent_step: str) -> str:
+        """Execute Crowbar code and return generated output"""
+        # Set up execution environment with persistent state
+        exec_globals = self._persistent_globals
+        # code blocks may override `indent_by`, affecting the blocks after it
+        exec_globals.setdefault("indent_by", indent_step)
 
         # Collect rendered output
-        output_parts: List[str] = []
+        output_parts = self._scratch
+        output_parts.clear()
         e = Emitter(
             writer=output_parts.append,
             base_indent=base_indent,
@@ -456,22 +679,14 @@ class CrowbarPreprocessor:
         exec_globals["emit"] = emit
 
         # Execute the code block
-        exec(code, exec_globals)
-
-        # Update persistent state with any new imports or definitions
-        # Filter out Crowbar-specific functions and built-ins to avoid pollution
-        for key, value in exec_globals.items():
-            if key not in [
-                "crowbar",
-                "component",
-                "nl",
-                "fl",
-                "indent",
-                "dedent",
-                "write_file",
-                "__builtins__",
-            ] and not key.startswith("_"):
-                self.crowbar_globals[key] = value
+        co = self._code_cache.get(code)
+        if co is None:
+            co = self._code_cache[code] = compile(code, "<crowbar block>", "exec")
+        try:
+            exec(co, exec_globals)
+        finally:
+            exec_globals.pop("emit", None)
+        e.flush()
 
         return "".join(output_parts)
 
@@ -482,7 +697,7 @@ class CrowbarPreprocessor:
         indent_step: str = "  ",
         omit_code_blocks: bool = False,
     ) -> None:
-        self.crowbar_globals: Dict[str, Any] = {}
+        self._reset_globals()
         input_path = Path(input_file).resolve()
         output_path = Path(input_file if output_file is None else output_file)
         if output_path.exists() and not output_path.is_file():
@@ -500,22 +715,39 @@ class CrowbarPreprocessor:
             suffix=".tmp",
         ) as tmp:
             tmp_path = Path(tmp.name)
+            # make modules next to the input file importable from its code blocks
+            self._use_input_dir(str(input_path.parent))
             try:
-                sys.path.insert(1, str(input_path.parent))
+                parts: List[str] = []
+                parts_len = 0
                 with open(input_file, "r", encoding="utf-8") as fh:
-                    for code_block_line, out_line in _block_parser(
-                        iter(fh), self.execute_code_block, indent_step
-                    ):
-                        if omit_code_blocks and code_block_line:
-                            continue
-                        tmp.write(out_line)
-
-                shutil.move(tmp_path, output_path)
+                    # NOTE: not `read().splitlines(keepends=True)`, it also splits on
+                    #       form feeds, \x1c-\x1e, \u2028 etc, which would shift the
+                    #       line numbers reported in errors. (It isn't faster either.)
+                    lines = fh.readlines()
+                for code_block_line, out_line in _block_parser(
+                    lines, self.execute_code_block, indent_step
+                ):
+                    if omit_code_blocks and code_block_line:
+                        continue
+                    parts.append(out_line)
+                    parts_len += len(out_line)
+                    if parts_len >= WRITE_CHUNK_SIZE:
+                        tmp.write("".join(parts))
+                        parts.clear()
+                        parts_len = 0
+                tmp.write("".join(parts))
+                tmp.flush()
+
+                os.replace(tmp_path, output_path)
             except Exception as e:
                 tmp_path.unlink(missing_ok=True)
                 raise FileParseError(input_file, e) from e
-            finally:
-                sys.path.pop(1)
+
+
+# code blocks and component modules import `crowbar`, make sure that is this
+# module, also when run as a script
+sys.modules.setdefault("crowbar", sys.modules[__name__])
 
 
 def main() -> None:
@@ -567,6 +799,7 @@ if __name__ == "__main__":
 # Export commonly used symbols
 __all__ = [
     "component",
+    "component_template",
     "Emitter",
     "nl",
     "fl",
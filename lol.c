@@ -57,7 +57,7 @@ int main(void) {
    printf("TAP version 14\n");
    printf("1..5\n");
    {
-      char tmpfile[] = "/tmp/tap_test_1";
+      char tmpfile[] = "/tmp/tap_test_XXXXXX";
       int tmpfd = mkstemp(tmpfile);
       if (tmpfd == -1) {
          printf("not ok 1 - test_program() (tmpfile creation failed)\n");
@@ -132,7 +132,7 @@ int main(void) {
       }
    }
    {
-      char tmpfile[] = "/tmp/tap_test_2";
+      char tmpfile[] = "/tmp/tap_test_XXXXXX";
       int tmpfd = mkstemp(tmpfile);
       if (tmpfd == -1) {
          printf("not ok 2 - test_add(2, 3, 5) (tmpfile creation failed)\n");
@@ -207,7 +207,7 @@ int main(void) {
       }
    }
    {
-      char tmpfile[] = "/tmp/tap_test_3";
+      char tmpfile[] = "/tmp/tap_test_XXXXXX";
       int tmpfd = mkstemp(tmpfile);
       if (tmpfd == -1) {
          printf("not ok 3 - test_segfault() (tmpfile creation failed)\n");
@@ -282,7 +282,7 @@ int main(void) {
       }
    }
    {
-      char tmpfile[] = "/tmp/tap_test_4";
+      char tmpfile[] = "/tmp/tap_test_XXXXXX";
       int tmpfd = mkstemp(tmpfile);
       if (tmpfd == -1) {
          printf("not ok 4 - test_add(2, 3, 6) (tmpfile creation failed)\n");
@@ -357,7 +357,7 @@ int main(void) {
       }
    }
    {
-      char tmpfile[] = "/tmp/tap_test_5";
+      char tmpfile[] = "/tmp/tap_test_XXXXXX";
       int tmpfd = mkstemp(tmpfile);
       if (tmpfd == -1) {
          printf("not ok 5 - test_add(4, 8, 12) (tmpfile creation failed)\n");
@@ -1,69 +1,111 @@
 from typing import Tuple
 from crowbar import *
-from dataclasses import dataclass
+from crowbar import ComponentClosure as _ComponentClosure
+from dataclasses import dataclass, field as _field
+from functools import lru_cache as _lru_cache
+from string import Template as _Template
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Test:
     fn: str
     args: str = ""
+    # frozen, so the label can be built once
+    _name: str = _field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "_name", f'{self.fn}({self.args})')
 
     def name(self) -> str:
-        return f'{self.fn}({self.args})'
+        return self._name
 
 
 TestArg = str | Tuple[str, str] | Test
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CImport:
     name: str
     sys: bool = False
 
 
+def _test_from_tuple(test: Tuple[str, str]) -> Test:
+    fn, args = test
+    return Test(fn=fn, args=args)
+
+
+# how to turn each accepted `TestArg` type into a `Test`
+_TEST_CTORS = {
+    str: lambda test: Test(fn=test, args=""),
+    tuple: _test_from_tuple,
+    Test: lambda test: test,
+}
+
+
+def _as_test(test: TestArg) -> Test:
+    ctor = _TEST_CTORS.get(type(test))
+    if ctor is None:
+        # subclasses of the accepted types
+        for typ, typ_ctor in _TEST_CTORS.items():
+            if isinstance(test, typ):
+                ctor = typ_ctor
+                break
+        else:
+            # NOTE: CYA - not wasted effort
+            raise TypeError(f"expected str (test name), tuple (str, str) (test name and args) or Test type, got '{type(test).__name__}'")
+    return ctor(test)
+
+
 class TestRegistry:
     def __init__(self):
         self._tests = []
 
     def add_test(self, test: TestArg) -> None:
-        if isinstance(test, str):
-            test = Test(fn=test, args="")
-        elif isinstance(test, tuple):
-            fn, args = test
-            test = Test(fn=fn, args=args)
-        elif isinstance(test, Test):
-            ...
-        else:
-            # NOTE: CYA - not wasted effort
-            raise TypeError(f"expected str (test name), tuple (str, str) (test name and args) or Test type, got '{type(test).__name__}'")
-        self._tests.append(test)
+        self._tests.append(_as_test(test))
 
     def add_tests(self, *tests: TestArg) -> None:
-        for test in tests:
-            self.add_test(test)
+        self._tests.extend(map(_as_test, tests))
 
+    @property
+    def tests(self) -> Tuple[Test, ...]:
+        """snapshot of the registered tests, in order of registration."""
+        return tuple(self._tests)
 
-@component
-def tap_plan(emit, count):
-    emit(f'printf("1..{count}\\n");')
+
+@component_template('printf("1..{count}\\n");')
+def tap_plan(emit, count): ...
+
+
+# NOTE: keys include the test number, each test adds 7 lines (6 without a
+#       timeout). The cache only pays off when re-rendering suites of up to
+#       ~585 tests (~680 without a timeout), beyond that a sequential
+#       re-render evicts every line before it is reused.
+@_lru_cache(maxsize=4096, typed=True)
+def _tap_ok_line(ok: bool, num: int, test_lbl: str, desc: str|None = None, params: str|None = None) -> str:
+    status = "ok" if ok else "not ok"
+    desc = f' ({desc})' if desc else ""
+    params = f', {params}' if params else ""
+    return f'printf("{status} {num} - {test_lbl}{desc}\\n"{params});'
 
 
 @component
 def tap_ok(emit, ok: bool, num: int, test_lbl: str, desc: str|None = None, params:str|None = None):
-    if desc:
-        desc = f' ({desc})'
-    else:
-        desc = ""
-    status = "ok" if ok else "not ok"
-    emit(f'printf("{status} {num} - {test_lbl}{desc}\\n"')
-    if params:
-        emit(lc, ", ", lc, params)
-    emit(lc, ");")
+    emit(_tap_ok_line(ok, num, test_lbl, desc, params))
+
+
+# specialized `tap_ok` variants, used by the generated test calls
+@component
+def tap_ok_pass(emit, num: int, test_lbl: str):
+    emit(_tap_ok_line(True, num, test_lbl))
 
 
 @component
-def tap_dmsg(emit, msg):
-    emit(f'printf("# {msg}\\n");')
+def tap_ok_fail(emit, num: int, test_lbl: str, desc: str|None = None, params:str|None = None):
+    emit(_tap_ok_line(False, num, test_lbl, desc, params))
+
+
+@component_template('printf("# {msg}\\n");')
+def tap_dmsg(emit, msg): ...
 
 
 @component
@@ -74,44 +116,51 @@ def c_import(emit, cimp: CImport):
         emit(f'# "{cimp.name}"')
 
 
-@component
-def tap_includes(emit):
-    emit(
-        '#include <stdio.h>',
-        '#include <stdlib.h>',
-        '#include <string.h>',
-    )
+@component_template(
+    '#include <stdio.h>\n'
+    '#include <stdlib.h>\n'
+    '#include <string.h>'
+)
+def tap_includes(emit): ...
+
+
+# static parts of `tap_test_child`
+_CHILD_REDIRECT = (
+    "dup2(tmpfd, STDERR_FILENO);",
+    "dup2(tmpfd, STDOUT_FILENO);",
+    "close(tmpfd);",
+)
+_CHILD_SETUP = (
+    "Allocator a;",
+    "tapd_stdalloc_init(&a);",
+    "Custodian c;",
+    "custodian_init(&c, NULL, &a);",
+)
+_CHILD_TEARDOWN = (
+    'custodian_shutdown(&c);',
+    "exit(result);",
+)
 
 
 @component
 def tap_test_child(emit, num, test: Test, timeout_secs: int|None):
-    emit(
-        "dup2(tmpfd, STDERR_FILENO);",
-        "dup2(tmpfd, STDOUT_FILENO);",
-        "close(tmpfd);"
-    )
+    timeout: Tuple[str, ...]
     if timeout_secs is not None:
-        emit(
-            "/* set timeout alarm */",
-            f'alarm({timeout_secs});',
-        )
-    emit(
-        "Allocator a;",
-        "tapd_stdalloc_init(&a);",
-        "Custodian c;",
-        "custodian_init(&c, NULL, &a);"
-    )
-    if test.args:
-        emit(f'int result = {test.fn}(&c, {test.args});')
+        timeout = ("/* set timeout alarm */", f'alarm({timeout_secs});')
     else:
-        emit(f'int result = {test.fn}(&c);')
+        timeout = ()
+    fn, args = test.fn, test.args
+    call_args = f', {args}' if args else ""
     emit(
-        f'custodian_shutdown(&c);',
-        "exit(result);"
+        *_CHILD_REDIRECT,
+        *timeout,
+        *_CHILD_SETUP,
+        f'int result = {fn}(&c{call_args});',
+        *_CHILD_TEARDOWN,
     )
 
 
-@component
+@component(pure=True)
 def tap_dump_test_output(emit, tmpfd):
     """
     Reads captured stdout/stderr from tmpfd and outputs it as TAP diagnostics.
@@ -164,20 +213,21 @@ def tap_dump_test_output(emit, tmpfd):
 
 @component
 def tap_test_parent_timeout(emit, num, test: Test, timeout_secs: int|None):
+    lbl = test.name()
+    # closures can be rendered any number of times
+    killed_by_signal = tap_ok_fail(num, lbl, "killed by signal %d", "WTERMSIG(status)")
     if timeout_secs is None:
-        emit(
-            tap_ok(False, num, test.name(), "killed by signal %d", "WTERMSIG(status)")
-        )
+        emit(killed_by_signal)
         return
 
     emit(
         "if (WTERMSIG(status) == SIGALRM) {",
         [
-            tap_ok(False, num, test.name(), f"timeout after {timeout_secs}s"),
+            tap_ok_fail(num, lbl, f"timeout after {timeout_secs}s"),
         ],
         "} else {",
         [
-            tap_ok(False, num, test.name(), "killed by signal %d", "WTERMSIG(status)"),
+            killed_by_signal,
         ],
         "}",
     )
@@ -185,17 +235,18 @@ def tap_test_parent_timeout(emit, num, test: Test, timeout_secs: int|None):
 
 @component
 def tap_test_parent(emit, num, test: Test, timeout_secs: int|None):
+    lbl = test.name()
     emit(
         "int status;",
         "waitpid(pid, &status, 0);",
         nl,
         "if (WIFEXITED(status) && WEXITSTATUS(status) == 0) {",
-        [tap_ok(True, num, test.name())],
+        [tap_ok_pass(num, lbl)],
         "} else {",
         [
             "if (WIFEXITED(status)) {",
             [
-                tap_ok(False, num, test.name(), "exit code: %d", "WEXITSTATUS(status)"),
+                tap_ok_fail(num, lbl, "exit code: %d", "WEXITSTATUS(status)"),
             ],
             "} else if (WIFSIGNALED(status)) {",
             [
@@ -203,7 +254,7 @@ def tap_test_parent(emit, num, test: Test, timeout_secs: int|None):
             ],
             "} else {",
             [
-                tap_ok(False, num, test.name(), "unknown failure"),
+                tap_ok_fail(num, lbl, "unknown failure"),
             ],
             "}",
             tap_dump_test_output("tmpfd"),
@@ -213,15 +264,21 @@ def tap_test_parent(emit, num, test: Test, timeout_secs: int|None):
     )
 
 
+# mkstemp() requires the template to end in "XXXXXX", it generates a unique
+# name in its place, so the same declaration serves every test
+_TMPFILE_DECL = 'char tmpfile[] = "/tmp/tap_test_XXXXXX";'
+
+
 @component
 def tap_test_call(emit, num: int, test: Test, timeout_secs: int|None):
+    lbl = test.name()
     emit(
         "{",
         [
-            f'char tmpfile[] = "/tmp/tap_test_{num}";',
+            _TMPFILE_DECL,
             'int tmpfd = mkstemp(tmpfile);',
             'if (tmpfd == -1) {',
-            [tap_ok(False, num, test.name(), "tmpfile creation failed")],
+            [tap_ok_fail(num, lbl, "tmpfile creation failed")],
             "} else {",
             [
                 "pid_t pid = fork();",
@@ -233,7 +290,7 @@ def tap_test_call(emit, num: int, test: Test, timeout_secs: int|None):
                 [
                     "close(tmpfd);",
                     "unlink(tmpfile);",
-                    tap_ok(False, num, test.name(), "fork failed"),
+                    tap_ok_fail(num, lbl, "fork failed"),
                 ],
                 "}",
             ],
@@ -243,10 +300,10 @@ def tap_test_call(emit, num: int, test: Test, timeout_secs: int|None):
     )
 
 @component
-def tap_program(emit, reg: TestRegistry):
-    tests = reg._tests
+def tap_program(emit, reg: TestRegistry, timeout_secs: int|None = 10):
+    tests = reg.tests
     test_calls = [
-        tap_test_call(num, test, timeout_secs=10)
+        tap_test_call(num, test, timeout_secs=timeout_secs)
         for num, test in enumerate(tests, start=1)
     ]
     emit(
@@ -259,3 +316,95 @@ def tap_program(emit, reg: TestRegistry):
         "}"
     )
 
+
+# placeholders for the per-test values, while rendering the skeletons below
+_PLACEHOLDERS = {name: f"\x00{name}\x00" for name in ("num", "fn", "args", "timeout_secs")}
+
+
+def _record(args: tuple, out: list[object]) -> None:
+    """flatten arguments to emit() into `out`, as the Emitter would walk them."""
+    for arg in args:
+        if isinstance(arg, list):
+            out.append(indent)
+            _record(tuple(arg), out)
+            out.append(dedent)
+        elif isinstance(arg, _ComponentClosure):
+            arg(lambda *args: _record(args, out))
+        elif arg is not None:
+            out.append(arg)
+
+
+def _test_skeleton(timeout: bool, has_args: bool) -> Tuple[tuple, tuple, _Template]:
+    """
+    Render `tap_test_call` once, with placeholders for the per-test values,
+    into a skeleton of arguments for emit().
+
+    Returns the layout, the tokens `tap_test_call` emits, the positions of the
+    lines holding placeholders and a `string.Template` of those lines, see `_fill_tokens`.
+    """
+    ph = _PLACEHOLDERS
+    test = Test(ph["fn"], ph["args"] if has_args else "")
+    layout: list[object] = []
+    _record((tap_test_call(ph["num"], test, ph["timeout_secs"] if timeout else None),), layout)
+    positions = []
+    lines = []
+    for pos, token in enumerate(layout):
+        if isinstance(token, str) and "\x00" in token:
+            line = token.replace("$", "$$")
+            for name, placeholder in ph.items():
+                line = line.replace(placeholder, f"${{{name}}}")
+            positions.append(pos)
+            lines.append(line)
+    return tuple(layout), tuple(positions), _Template("\n".join(lines))
+
+
+def _fill_tokens(skeleton: Tuple[tuple, tuple, _Template], **ctx) -> list:
+    layout, positions, tmpl = skeleton
+    # substitute all lines in one go, then put them back in place
+    lines = tmpl.substitute(ctx).split("\n")
+    if len(lines) != len(positions):
+        # a value spans multiple lines, substitute line by line instead
+        lines = [_Template(line).substitute(ctx) for line in tmpl.template.split("\n")]
+    tokens = list(layout)
+    for pos, line in zip(positions, lines):
+        tokens[pos] = line
+    return tokens
+
+
+# test call code, by whether tests have a timeout and whether they take arguments
+_TEST_TOKENS = {
+    (timeout, has_args): _test_skeleton(timeout, has_args)
+    for timeout in (True, False)
+    for has_args in (True, False)
+}
+
+
+@component
+def tap_program_fast(emit, reg: TestRegistry, timeout_secs: int|None = 10):
+    """
+    Same output as `tap_program`, but each test's code is filled in from
+    a skeleton of `tap_test_call`, rendered once, rather than composed from
+    components for every test.
+    """
+    tests = reg.tests
+    # the timeout is the same for every test, pick the code for it once
+    timeout = timeout_secs is not None
+    test_calls = []
+    for num, test in enumerate(tests, start=1):
+        args = test.args
+        test_calls.extend(_fill_tokens(
+            _TEST_TOKENS[timeout, bool(args)],
+            num=num,
+            fn=test.fn,
+            args=args,
+            timeout_secs=timeout_secs,
+        ))
+    emit(
+        "int main(void) {", [
+            'printf("TAP version 14\\n");',
+            tap_plan(len(tests)),
+            *test_calls,
+            "return 0;",
+        ],
+        "}"
+    )